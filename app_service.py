@@ -0,0 +1,335 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import hashlib
+import bisect
+from functools import lru_cache
+from urllib.parse import parse_qs
+from file_io import write_atomic
+
+# Read-side API for the app. Instead of shipping the wide frame produced by
+# get_votes_df_for_app, votes are precomputed into one compact snapshot per
+# sitting (Cleaned_data/snapshots/EP{n}/sitting-YYYY-MM-DD.json) and served as
+# per-sitting, per-voting and per-MEP slices. A snapshot directory holds a single
+# term (VoteIds are term-scoped, see ep_terms).
+# Run with: EP_TERM=9 uvicorn app_service:app (or EP_SNAPSHOT_DIR=... for any directory)
+
+MEP_COLUMNS = ['MepId', 'SeatId', 'Fname', 'Lname', 'FullName', 'Activ', 'Country', 'Party', 'EPG', 'Start', 'End']
+VOTING_COLUMNS = ['VoteId', 'Title', 'TypeOfVote', 'Rapporteur', 'CommitteeResponsabile', 'PolicyArea', 'Subject',
+                  'FinalVote', 'AmNo', 'Author', 'Vote', 'Yes', 'No', 'Abs']
+MISSING_VOTE = '-'
+# Cells of the term-wide MEP index: a vote code, no record in the snapshot, or MEP not in that sitting
+MISSING_CODE = 255
+NOT_IN_SITTING = 254
+VOTE_SUFFIXES = {code: b'%d}' % code for code in range(10)}
+VOTE_SUFFIXES[MISSING_CODE] = b'null}'
+
+
+def term_snapshot_dir(ep_number, base_directory=None):
+    if base_directory is None:
+        base_directory = os.path.join("Cleaned_data", "snapshots")
+    return os.path.join(base_directory, f"EP{ep_number}")
+
+
+def to_json_value(value):
+    # Make pandas/numpy scalars JSON serialisable
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def encode_votes(codes):
+    # One character per MEP, in the sitting's MEP order
+    return ''.join(MISSING_VOTE if pd.isna(code) else str(int(code)) for code in codes)
+
+
+def write_snapshot(path, snapshot):
+    payload = json.dumps(snapshot, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    # Leave a sitting untouched when its content is unchanged, so its ETag stays stable
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == payload:
+                return False
+    write_atomic(path, payload)
+    return True
+
+
+def build_snapshots(votes_df, votings_df, mep_df, snapshot_dir):
+    # votes_df is in long format (VoteId, MepId, Vote) as in votes_EP_x.csv / get_votes_for_database
+    os.makedirs(snapshot_dir, exist_ok=True)
+    votings_df = votings_df.copy()
+    votings_df['Date'] = pd.to_datetime(votings_df['Date'])
+    votings_df['VoteId'] = votings_df['VoteId'].astype('Int64')
+    votes_df = votes_df[['VoteId', 'MepId', 'Vote']].copy()
+    votes_df['VoteId'] = votes_df['VoteId'].astype('Int64')
+    votes_df['MepId'] = votes_df['MepId'].astype('Int64')
+    votes_df = votes_df.merge(votings_df[['VoteId', 'Date']], on='VoteId', how='inner')
+
+    voting_columns = [col for col in VOTING_COLUMNS if col in votings_df.columns]
+    written = 0
+    for date, sitting_votes in votes_df.groupby('Date', sort=True):
+        date_str = date.strftime('%Y-%m-%d')
+        # Wide MEP x voting matrix for this sitting only
+        matrix = sitting_votes.pivot_table(index='MepId', columns='VoteId', values='Vote', aggfunc='first',
+                                           dropna=False)
+        mep_ids = [int(mep_id) for mep_id in matrix.index]
+        sitting_votings = votings_df[votings_df['Date'] == date].drop_duplicates('VoteId')
+        votings = []
+        for _, row in sitting_votings.iterrows():
+            voting = {col: to_json_value(row[col]) for col in voting_columns}
+            if row['VoteId'] in matrix.columns:
+                voting['votes'] = encode_votes(matrix[row['VoteId']].tolist())
+            else:
+                voting['votes'] = MISSING_VOTE * len(mep_ids)
+            votings.append(voting)
+        snapshot = {'date': date_str, 'meps': mep_ids, 'votings': votings}
+        if write_snapshot(os.path.join(snapshot_dir, f"sitting-{date_str}.json"), snapshot):
+            written += 1
+
+    mep_columns = [col for col in MEP_COLUMNS if col in mep_df.columns]
+    meps = [{col: to_json_value(row[col]) for col in mep_columns} for _, row in mep_df.iterrows()]
+    write_snapshot(os.path.join(snapshot_dir, "meps.json"), {'meps': meps})
+    print(f"{written} sitting snapshots written to {snapshot_dir}")
+    return written
+
+
+def build_snapshots_from_app_frame(votes_df, votings_df, snapshot_dir):
+    # Accepts the wide frame of get_votes_df_for_app (MEP columns plus one column per voting_id)
+    mep_columns = [col for col in MEP_COLUMNS if col in votes_df.columns]
+    vote_columns = [col for col in votes_df.columns if col not in mep_columns]
+    long_votes = pd.melt(votes_df, id_vars='MepId', value_vars=vote_columns, var_name='VoteId', value_name='Vote')
+    return build_snapshots(long_votes, votings_df, votes_df[mep_columns], snapshot_dir)
+
+
+class Snapshot:
+    def __init__(self, payload):
+        self.payload = payload
+        self.etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+        data = json.loads(payload)
+        self.date = data.get('date')
+        self.meps = data['meps']
+        self.votings = data.get('votings', [])
+        self.mep_positions = {mep_id: i for i, mep_id in enumerate(self.meps) if isinstance(mep_id, int)}
+        self.voting_positions = {voting['VoteId']: i for i, voting in enumerate(self.votings)}
+
+
+def read_snapshot(path, mtime_ns):
+    # mtime_ns is only part of the cache key, so rebuilt sittings are picked up
+    with open(path, 'rb') as f:
+        return Snapshot(f.read())
+
+
+def row_prefix(vote_id, date):
+    # '{"VoteId":1,"Date":"2024-01-15","Vote":' - the vote code and closing brace are appended per MEP
+    return json.dumps({'VoteId': vote_id, 'Date': date}, separators=(',', ':'))[:-1].encode('utf-8') + b',"Vote":'
+
+
+class MepIndex:
+    # All sittings of the directory in one (votings x MEPs) code matrix, votings in date order,
+    # so a /meps/{id} request is one column slice instead of a walk over every sitting
+    def __init__(self, snapshots):
+        mep_ids = sorted({mep_id for snapshot in snapshots for mep_id in snapshot.mep_positions})
+        self.mep_positions = {mep_id: i for i, mep_id in enumerate(mep_ids)}
+        n_votings = sum(len(snapshot.votings) for snapshot in snapshots)
+        self.codes = np.full((n_votings, len(mep_ids)), NOT_IN_SITTING, dtype=np.uint8)
+        self.dates = []
+        # Each row's JSON up to its vote code, encoded once so responses are joined rather than dumped
+        self.row_prefixes = []
+        row = 0
+        for snapshot in snapshots:
+            if not snapshot.votings:
+                continue
+            columns = [self.mep_positions[mep_id] for mep_id in snapshot.mep_positions]
+            positions = list(snapshot.mep_positions.values())
+            text = ''.join(voting['votes'] for voting in snapshot.votings).encode('ascii')
+            sitting_codes = np.frombuffer(text, dtype=np.uint8).reshape(len(snapshot.votings), len(snapshot.meps))
+            sitting_codes = np.where(sitting_codes == ord(MISSING_VOTE), MISSING_CODE, sitting_codes - ord('0'))
+            self.codes[row:row + len(snapshot.votings), columns] = sitting_codes[:, positions]
+            self.dates.extend([snapshot.date] * len(snapshot.votings))
+            self.row_prefixes.extend(row_prefix(voting['VoteId'], snapshot.date) for voting in snapshot.votings)
+            row += len(snapshot.votings)
+
+    def encode_votes(self, mep_id, start=None, end=None):
+        # JSON array of {"VoteId", "Date", "Vote"} for the MEP's sittings in the date window
+        column = self.mep_positions.get(mep_id)
+        if column is None:
+            return b'[]'
+        lo = bisect.bisect_left(self.dates, start) if start is not None else 0
+        hi = bisect.bisect_right(self.dates, end) if end is not None else len(self.dates)
+        codes = self.codes[lo:hi, column]
+        rows = np.flatnonzero(codes != NOT_IN_SITTING)
+        prefixes = self.row_prefixes
+        return b'[' + b','.join([prefixes[lo + i] + VOTE_SUFFIXES[code]
+                                 for i, code in zip(rows.tolist(), codes[rows].tolist())]) + b']'
+
+
+class SnapshotStore:
+    def __init__(self, snapshot_dir, cache_size=256):
+        self.snapshot_dir = snapshot_dir
+        self.load = lru_cache(maxsize=cache_size)(read_snapshot)
+        # Encoded /meps/{id} bodies; the index version in the key drops them when sittings change
+        self.mep_bodies = lru_cache(maxsize=cache_size)(self.encode_mep_votes)
+        self.index_mtime = None
+        self.index_version = 0
+        self.sittings = []
+        self.voting_dates = {}
+        self.mep_index = MepIndex([])
+
+    def refresh_index(self):
+        # Re-scan the directory only when files were added or removed
+        try:
+            mtime = os.stat(self.snapshot_dir).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.index_mtime:
+            return
+        names = sorted(name for name in os.listdir(self.snapshot_dir)
+                       if name.startswith('sitting-') and name.endswith('.json'))
+        self.sittings = [name[len('sitting-'):-len('.json')] for name in names]
+        # Sittings are read directly rather than through the LRU, so indexing does not evict it
+        snapshots = []
+        for name in names:
+            try:
+                with open(os.path.join(self.snapshot_dir, name), 'rb') as f:
+                    snapshots.append(Snapshot(f.read()))
+            except FileNotFoundError:
+                continue
+        self.voting_dates = {}
+        for snapshot in snapshots:
+            for voting_id in snapshot.voting_positions:
+                if voting_id in self.voting_dates:
+                    print(f"VoteId {voting_id} appears on {self.voting_dates[voting_id]} and {snapshot.date}; "
+                          f"{self.snapshot_dir} should hold a single term")
+                self.voting_dates[voting_id] = snapshot.date
+        self.mep_index = MepIndex(snapshots)
+        self.index_version += 1
+        self.index_mtime = mtime
+
+    def get_file(self, name):
+        path = os.path.join(self.snapshot_dir, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        return self.load(path, mtime)
+
+    def get_sitting(self, date):
+        return self.get_file(f"sitting-{date}.json")
+
+    def get_meps(self):
+        return self.get_file("meps.json")
+
+    def encode_mep_votes(self, index_version, mep_id, start, end):
+        return b'{"MepId":%d,"votes":' % mep_id + self.mep_index.encode_votes(mep_id, start, end) + b'}'
+
+    def get_mep_body(self, mep_id, start=None, end=None):
+        return self.mep_bodies(self.index_version, mep_id, start, end)
+
+
+def get_voting_slice(snapshot, voting_id):
+    position = snapshot.voting_positions.get(voting_id)
+    if position is None:
+        return None
+    voting = dict(snapshot.votings[position])
+    codes = voting.pop('votes')
+    voting['Date'] = snapshot.date
+    voting['votes'] = {str(mep_id): (None if code == MISSING_VOTE else int(code))
+                       for mep_id, code in zip(snapshot.meps, codes)}
+    return voting
+
+
+def parse_date(value):
+    # Sittings are bisected as 'YYYY-MM-DD' strings, so query dates are normalised to that form
+    if value is None:
+        return None
+    date = pd.Timestamp(value)
+    if pd.isna(date):
+        raise ValueError(f"Invalid date {value}")
+    return date.strftime('%Y-%m-%d')
+
+
+def json_response(body, etag=None, status=200):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if etag is None:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return status, body, etag
+
+
+def create_app(snapshot_dir, cache_size=256):
+    store = SnapshotStore(snapshot_dir, cache_size=cache_size)
+
+    def route(path, query):
+        store.refresh_index()
+        parts = [part for part in path.split('/') if part]
+        if parts == ['sittings']:
+            listing = []
+            for date in store.sittings:
+                snapshot = store.get_sitting(date)
+                if snapshot is not None:
+                    listing.append({'date': date, 'etag': snapshot.etag, 'votings': len(snapshot.votings)})
+            return json_response(listing)
+        if len(parts) == 2 and parts[0] == 'sittings':
+            snapshot = store.get_sitting(parts[1])
+            if snapshot is None:
+                return json_response({'error': f"No sitting on {parts[1]}"}, status=404)
+            return json_response(snapshot.payload, etag=snapshot.etag)
+        if len(parts) == 2 and parts[0] == 'votings':
+            try:
+                voting_id = int(parts[1])
+            except ValueError:
+                return json_response({'error': f"Invalid voting id {parts[1]}"}, status=400)
+            date = store.voting_dates.get(voting_id)
+            snapshot = store.get_sitting(date) if date is not None else None
+            voting = get_voting_slice(snapshot, voting_id) if snapshot is not None else None
+            if voting is None:
+                return json_response({'error': f"No voting with id {voting_id}"}, status=404)
+            return json_response(voting)
+        if parts == ['meps']:
+            meps = store.get_meps()
+            if meps is None:
+                return json_response({'error': "No MEP snapshot available"}, status=404)
+            return json_response(meps.payload, etag=meps.etag)
+        if len(parts) == 2 and parts[0] == 'meps':
+            try:
+                mep_id = int(parts[1])
+            except ValueError:
+                return json_response({'error': f"Invalid MEP id {parts[1]}"}, status=400)
+            try:
+                start = parse_date(query.get('from', [None])[0])
+                end = parse_date(query.get('to', [None])[0])
+            except ValueError:
+                return json_response({'error': "from/to must be dates such as 2024-01-05"}, status=400)
+            return json_response(store.get_mep_body(mep_id, start, end))
+        return json_response({'error': f"Unknown path {path}"}, status=404)
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        if scope['method'] not in ('GET', 'HEAD'):
+            status, body, etag = json_response({'error': "Method not allowed"}, status=405)
+        else:
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            status, body, etag = route(scope['path'], query)
+        headers = dict(scope.get('headers', []))
+        # Clients send back the ETag of their copy and only re-download changed sittings
+        if status == 200 and headers.get(b'if-none-match', b'').decode('latin-1') == etag:
+            status, body = 304, b''
+        response_headers = [(b'content-type', b'application/json'), (b'etag', etag.encode('latin-1')),
+                            (b'cache-control', b'no-cache'), (b'content-length', str(len(body)).encode())]
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': body if scope['method'] == 'GET' else b''})
+
+    return app
+
+
+app = create_app(os.environ.get('EP_SNAPSHOT_DIR') or term_snapshot_dir(int(os.environ.get('EP_TERM', 10))))
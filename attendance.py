@@ -0,0 +1,203 @@
+import pandas as pd
+import numpy as np
+import bisect
+import pipeline_metrics as pm
+from file_io import save_json_gz, load_json_gz, load_or_create
+from ep_terms import term_window, terms_for, term_vote_key
+
+# Running per-MEP attendance and participation, updated one sitting at a time instead of
+# rescanning the whole votes table. Vote codes follow categorize_vote_app:
+# 1/2/3 voted, 4 excused, 5 present but not voting, 0 not a sitting MEP (ignored).
+#
+# For every MEP (overall and per policy area) the accumulator keeps the sitting days and
+# the cumulative code counts up to each day, so any date window is answered from two
+# prefix sums:
+#
+#     accumulator = AttendanceAccumulator.load_or_create(path)
+#     accumulator.add_sitting(votes_df, votings_df)
+#     accumulator.get_rates_df(start='2023-01-01', end='2023-06-30', policy_area='Budgets')
+
+N_CODES = 6
+ALL_AREAS = ''
+
+
+def day_number(date):
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64))
+
+
+class CountSeries:
+    # Sitting days in order, with cumulative counts of each vote code up to and including that day
+    def __init__(self, days=None, cumulative=None):
+        self.days = days or []
+        self.cumulative = cumulative or []
+
+    def add(self, day, counts):
+        # Sittings normally arrive in order, which only appends
+        if not self.days or day > self.days[-1]:
+            previous = self.cumulative[-1] if self.cumulative else [0] * N_CODES
+            self.days.append(day)
+            self.cumulative.append([total + count for total, count in zip(previous, counts)])
+            return
+        position = bisect.bisect_left(self.days, day)
+        if position < len(self.days) and self.days[position] == day:
+            start = position
+        else:
+            previous = self.cumulative[position - 1] if position > 0 else [0] * N_CODES
+            self.days.insert(position, day)
+            self.cumulative.insert(position, list(previous))
+            start = position
+        for i in range(start, len(self.cumulative)):
+            self.cumulative[i] = [total + count for total, count in zip(self.cumulative[i], counts)]
+
+    def window(self, start_day=None, end_day=None):
+        end_position = (bisect.bisect_right(self.days, end_day) if end_day is not None else len(self.days)) - 1
+        start_position = (bisect.bisect_left(self.days, start_day) if start_day is not None else 0) - 1
+        if end_position < 0 or end_position <= start_position:
+            return [0] * N_CODES
+        upper = self.cumulative[end_position]
+        if start_position < 0:
+            return list(upper)
+        return [high - low for high, low in zip(upper, self.cumulative[start_position])]
+
+
+def summarize_counts(counts):
+    counts = np.asarray(counts, dtype=np.int64)
+    voted = counts[..., 1:4].sum(axis=-1)
+    excused = counts[..., 4]
+    present_not_voting = counts[..., 5]
+    eligible = counts[..., 1:6].sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        attendance = np.where(eligible > 0, (voted + present_not_voting) / eligible, np.nan)
+        participation = np.where(eligible > 0, voted / eligible, np.nan)
+    return {'Voted': voted, 'Excused': excused, 'PresentNotVoting': present_not_voting, 'Eligible': eligible,
+            'Attendance': attendance, 'Participation': participation}
+
+
+class AttendanceAccumulator:
+    def __init__(self):
+        self.series = {}
+        self.ingested_keys = set()
+
+    def add_sitting(self, votes_df, votings_df):
+        # votes_df is in long format (VoteId, MepId, Vote); votings_df gives Date and PolicyArea per VoteId.
+        # Votings that were already ingested are skipped, so re-running a sitting is harmless.
+        with pm.stage('accumulate_attendance') as stage:
+            votings = votings_df[['VoteId', 'Date'] + (['PolicyArea'] if 'PolicyArea' in votings_df.columns else [])]
+            votings = votings.copy()
+            votings['VoteId'] = votings['VoteId'].astype('Int64')
+            votings['Term'] = terms_for(votings_df)
+            votings = votings[votings['VoteId'].notna()].drop_duplicates(['Term', 'VoteId'])
+            keys = [term_vote_key(term, vote_id) for term, vote_id in zip(votings['Term'], votings['VoteId'])]
+            votings = votings[[key not in self.ingested_keys for key in keys]]
+            if votings.empty:
+                return 0
+            if 'PolicyArea' not in votings.columns:
+                votings['PolicyArea'] = ALL_AREAS
+            # votes_df carries EP_ID when it spans several terms (e.g. the merged dataset)
+            votes = votes_df[['VoteId', 'MepId', 'Vote'] + (['EP_ID'] if 'EP_ID' in votes_df.columns else [])].copy()
+            votes['VoteId'] = votes['VoteId'].astype('Int64')
+            if 'EP_ID' in votes.columns:
+                votes = votes.rename(columns={'EP_ID': 'Term'}).merge(votings, on=['Term', 'VoteId'], how='inner')
+            elif votings['Term'].nunique() > 1:
+                raise ValueError("votes_df needs an EP_ID column when votings_df spans several terms")
+            else:
+                votes = votes.merge(votings, on='VoteId', how='inner')
+            votes = votes[votes['Vote'].between(0, N_CODES - 1) & votes['MepId'].notna()]
+            # Only votings with votes in this call count as ingested; callers may pass the whole term's votings
+            ingested = votes[['Term', 'VoteId']].drop_duplicates()
+            if ingested.empty:
+                return 0
+            areas = votes['PolicyArea'].fillna(ALL_AREAS).astype(str).replace({'None': ALL_AREAS, 'nan': ALL_AREAS})
+            days = pd.to_datetime(votes['Date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+            # Counted one sitting day at a time, so the dense (MEP, policy area, code) array covers a single
+            # day however many days arrive at once (a whole-term backfill has hundreds)
+            mep_column = votes['MepId'].to_numpy(dtype=np.int64)
+            area_column = areas.to_numpy()
+            code_column = votes['Vote'].to_numpy(dtype=np.int64)
+            order = np.argsort(days, kind='stable')
+            day_values, day_starts = np.unique(days[order], return_index=True)
+            for day, rows in zip(day_values.tolist(), np.split(order, day_starts[1:])):
+                mep_index, mep_ids = pd.factorize(mep_column[rows])
+                area_index, area_values = pd.factorize(area_column[rows])
+                shape = (len(mep_ids), len(area_values), N_CODES)
+                flat = (mep_index * shape[1] + area_index) * N_CODES + code_column[rows]
+                counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+
+                totals = counts.sum(axis=1)
+                for i in np.nonzero(totals.any(axis=1))[0]:
+                    self.add_counts(int(mep_ids[i]), ALL_AREAS, day, totals[i].tolist())
+                for i, k in zip(*np.nonzero(counts.any(axis=2))):
+                    if area_values[k] != ALL_AREAS:
+                        self.add_counts(int(mep_ids[i]), area_values[k], day, counts[i, k].tolist())
+            self.ingested_keys.update(term_vote_key(term, vote_id)
+                                      for term, vote_id in zip(ingested['Term'], ingested['VoteId']))
+            stage.add_rows(len(votes))
+        return len(ingested)
+
+    def add_counts(self, mep_id, area, day, counts):
+        series = self.series.get((mep_id, area))
+        if series is None:
+            series = self.series[(mep_id, area)] = CountSeries()
+        series.add(day, counts)
+
+    def get_counts(self, mep_id, start=None, end=None, policy_area=None):
+        series = self.series.get((int(mep_id), policy_area or ALL_AREAS))
+        if series is None:
+            return [0] * N_CODES
+        return series.window(day_number(start) if start is not None else None,
+                             day_number(end) if end is not None else None)
+
+    def get_rates(self, mep_id, start=None, end=None, policy_area=None, term=None):
+        if term is not None:
+            start, end = term_window(term)
+        summary = summarize_counts(self.get_counts(mep_id, start, end, policy_area))
+        return {name: value.item() for name, value in summary.items()}
+
+    def get_rates_df(self, start=None, end=None, policy_area=None, term=None):
+        # All MEPs for one window; each row costs two binary searches
+        if term is not None:
+            start, end = term_window(term)
+        start_day = day_number(start) if start is not None else None
+        end_day = day_number(end) if end is not None else None
+        area = policy_area or ALL_AREAS
+        mep_ids = sorted(mep_id for mep_id, key_area in self.series if key_area == area)
+        counts = [self.series[(mep_id, area)].window(start_day, end_day) for mep_id in mep_ids]
+        rates_df = pd.DataFrame(summarize_counts(np.array(counts, dtype=np.int64).reshape(-1, N_CODES)))
+        rates_df.insert(0, 'MepId', mep_ids)
+        return rates_df[rates_df['Eligible'] > 0].reset_index(drop=True)
+
+    def get_monthly_rates(self, mep_id, policy_area=None):
+        series = self.series.get((int(mep_id), policy_area or ALL_AREAS))
+        if series is None or not series.days:
+            return pd.DataFrame(columns=['Month', 'Voted', 'Excused', 'PresentNotVoting', 'Eligible', 'Attendance',
+                                         'Participation'])
+        first = pd.Timestamp(np.datetime64(series.days[0], 'D')).to_period('M')
+        last = pd.Timestamp(np.datetime64(series.days[-1], 'D')).to_period('M')
+        months = pd.period_range(first, last, freq='M')
+        counts = [series.window(day_number(month.start_time), day_number(month.end_time)) for month in months]
+        monthly_df = pd.DataFrame(summarize_counts(np.array(counts, dtype=np.int64)))
+        monthly_df.insert(0, 'Month', months.astype(str))
+        return monthly_df[monthly_df['Eligible'] > 0].reset_index(drop=True)
+
+    def get_policy_areas(self, mep_id):
+        return sorted(area for key_mep, area in self.series if key_mep == int(mep_id) and area != ALL_AREAS)
+
+    def save(self, path):
+        data = {
+            'ingested_keys': sorted(self.ingested_keys),
+            'series': [[mep_id, area, series.days, series.cumulative]
+                       for (mep_id, area), series in self.series.items()],
+        }
+        save_json_gz(path, data)
+
+    @classmethod
+    def load(cls, path):
+        data = load_json_gz(path)
+        accumulator = cls()
+        accumulator.ingested_keys = set(data['ingested_keys'])
+        for mep_id, area, days, cumulative in data['series']:
+            accumulator.series[(mep_id, area)] = CountSeries(days, cumulative)
+        return accumulator
+
+    load_or_create = classmethod(load_or_create)
@@ -0,0 +1,160 @@
+import pandas as pd
+import numpy as np
+import pipeline_metrics as pm
+
+# "Which votes would have passed if group X had voted with group Y?"
+# For every coalition of political groups (all 2^k subsets) the groups in the coalition
+# vote en bloc, everyone else votes as recorded, and each roll call is re-evaluated under
+# its VotingRule. All coalitions and roll calls are evaluated at once: the per-group
+# breakdown (roll calls x groups x yes/no/abs) is multiplied by the 2^k x k coalition
+# bitmask matrix.
+#
+#     breakdown = get_epg_breakdown(votes_df, votings_df, memberships_df)
+#     passes_df, pivotality_df = simulate_coalitions(breakdown, votings_df)
+
+EPG_CLASSIFICATION = "def/ep-entities/EU_POLITICAL_GROUP"
+UNKNOWN_GROUP = 'Unknown'
+# The passes matrix is 2^k coalitions x roll calls; 12 groups keep a full term under ~100 MB
+MAX_GROUPS = 12
+# Coalition x roll call cells evaluated at once, bounding the intermediate tally arrays
+CHUNK_CELLS = 2 ** 20
+
+
+def resolve_epgs(votes_df, votings_df, memberships_df):
+    # Vectorized get_epg: the EPG membership of each MEP on each sitting date
+    votes = votes_df[['VoteId', 'MepId', 'Vote']].copy()
+    votes['VoteId'] = votes['VoteId'].astype('Int64')
+    votes['MepId'] = votes['MepId'].astype('Int64')
+    dates = votings_df[['VoteId', 'Date']].drop_duplicates('VoteId').copy()
+    dates['VoteId'] = dates['VoteId'].astype('Int64')
+    dates['Date'] = pd.to_datetime(dates['Date'])
+    votes = votes.merge(dates, on='VoteId', how='left')
+
+    epg = memberships_df[memberships_df['membershipClassification'].astype(str) == EPG_CLASSIFICATION]
+    epg = pd.DataFrame({
+        'MepId': epg['identifier'].astype('Int64'),
+        'Start': pd.to_datetime(epg['memberDuring.startDate']),
+        'End': pd.to_datetime(epg['memberDuring.endDate']),
+        'EPG': epg['org_label'],
+    })
+    pairs = votes[['MepId', 'Date']].drop_duplicates().merge(epg, on='MepId', how='inner')
+    pairs = pairs[(pairs['Start'] <= pairs['Date']) & (pairs['End'].isna() | (pairs['End'] >= pairs['Date']))]
+    pairs = pairs.drop_duplicates(['MepId', 'Date'])[['MepId', 'Date', 'EPG']]
+    return votes.merge(pairs, on=['MepId', 'Date'], how='left')
+
+
+def get_epg_breakdown(votes_df, votings_df, memberships_df=None):
+    # Yes/No/Abs counts per roll call and group; votes_df may already carry an EPG column
+    with pm.stage('epg_breakdown') as stage:
+        if 'EPG' in votes_df.columns:
+            votes = votes_df[['VoteId', 'MepId', 'Vote', 'EPG']]
+        else:
+            votes = resolve_epgs(votes_df, votings_df, memberships_df)
+        codes = votes['Vote'].to_numpy(dtype=np.int64, na_value=0)
+        vote_index, vote_ids = pd.factorize(votes['VoteId'], sort=True)
+        sitting = (codes >= 1) & (codes <= 5)
+        cast = (codes >= 1) & (codes <= 3)
+        # Groups come from cast votes only; MEPs out of office (code 0) have no group and would
+        # otherwise add an empty Unknown group that doubles the number of coalitions
+        group_index, groups = pd.factorize(votes['EPG'].fillna(UNKNOWN_GROUP).to_numpy()[cast], sort=True)
+        counts = np.bincount((vote_index[cast] * len(groups) + group_index) * 3 + codes[cast] - 1,
+                             minlength=len(vote_ids) * len(groups) * 3).reshape(len(vote_ids), len(groups), 3)
+        members = np.bincount(vote_index[sitting], minlength=len(vote_ids))
+        stage.add_rows(len(votes))
+    return {'vote_ids': np.asarray(vote_ids), 'groups': list(groups), 'counts': counts, 'members': members}
+
+
+def coalition_masks(n_groups):
+    # Row s is the membership vector of coalition s (bit g set = group g in the coalition)
+    coalitions = np.arange(2 ** n_groups)
+    return ((coalitions[:, None] >> np.arange(n_groups)[None, :]) & 1).astype(np.int32)
+
+
+def evaluate_rules(yes, no, abstain, members, rules):
+    # 's': simple majority of votes cast; 'a'/'q': majority of component members;
+    # 't': two thirds of votes cast representing a majority of component members
+    absolute = members // 2 + 1
+    simple = yes > no
+    absolute_majority = yes >= absolute
+    two_thirds = (3 * yes >= 2 * (yes + no + abstain)) & absolute_majority
+    return np.where(rules == 'a', absolute_majority,
+                    np.where(rules == 't', two_thirds, simple))
+
+
+def normalize_rules(votings_df, vote_ids):
+    votings = votings_df.drop_duplicates('VoteId')
+    rules = pd.Series(votings['VotingRule'].values if 'VotingRule' in votings.columns else 's',
+                      index=votings['VoteId'].astype('Int64'))
+    rules = rules.reindex(pd.Index(vote_ids).astype('Int64')).fillna('s').astype(str).str.strip().str.lower()
+    rules = rules.replace({'q': 'a', '2/3': 't'})
+    unknown = sorted(set(rules) - {'s', 'a', 't'})
+    if unknown:
+        print(f"Unknown voting rules {unknown} evaluated as simple majority")
+    return rules.to_numpy()
+
+
+def evaluate_coalitions(masks, counts, totals, members, rules, position):
+    # (coalitions x groups) @ (groups x roll calls) for each of yes/no/abs
+    inside = masks[None, :, :] @ counts
+    cast_inside = inside.sum(axis=0)
+    outside = totals[:, None, :] - inside
+    if position == 'yes':
+        bloc_yes = cast_inside
+    elif position == 'no':
+        bloc_yes = np.zeros_like(cast_inside)
+    else:
+        bloc_yes = np.where(inside[0] > inside[1], cast_inside, 0)
+    bloc_no = cast_inside - bloc_yes
+    return evaluate_rules(outside[0] + bloc_yes, outside[1] + bloc_no, outside[2], members[None, :], rules[None, :])
+
+
+def simulate_coalitions(breakdown, votings_df, position='yes', component_members=None):
+    # position: what the coalition does as a bloc - 'yes', 'no', or 'majority' (its combined majority)
+    groups = breakdown['groups']
+    if len(groups) > MAX_GROUPS:
+        raise ValueError(f"{len(groups)} groups give {2 ** len(groups)} coalitions; at most {MAX_GROUPS} supported")
+    if position not in ('yes', 'no', 'majority'):
+        raise ValueError(f"Unknown position {position}")
+    with pm.stage('simulate_coalitions') as stage:
+        counts = np.ascontiguousarray(breakdown['counts'].astype(np.int32).transpose(2, 1, 0))
+        members = (np.full(len(breakdown['vote_ids']), component_members, dtype=np.int32)
+                   if component_members is not None else breakdown['members'].astype(np.int32))
+        rules = normalize_rules(votings_df, breakdown['vote_ids'])
+        masks = coalition_masks(len(groups))
+        totals = counts.sum(axis=1)
+        actual = evaluate_rules(totals[0], totals[1], totals[2], members, rules)
+
+        # Coalitions are evaluated in blocks of rows of masks so the tallies stay CHUNK_CELLS wide
+        chunk = max(1, CHUNK_CELLS // max(1, len(breakdown['vote_ids'])))
+        passes = np.empty((len(masks), len(breakdown['vote_ids'])), dtype=bool)
+        for lo in range(0, len(masks), chunk):
+            passes[lo:lo + chunk] = evaluate_coalitions(masks[lo:lo + chunk], counts, totals, members, rules,
+                                                        position)
+
+        # Group g is pivotal for coalition s on a roll call if s passes it and s without g does not
+        pivotal = np.zeros(masks.shape, dtype=np.int64)
+        for g in range(len(groups)):
+            with_group = np.flatnonzero(masks[:, g])
+            for lo in range(0, len(with_group), chunk):
+                rows = with_group[lo:lo + chunk]
+                pivotal[rows, g] = (passes[rows] & ~passes[rows ^ (1 << g)]).sum(axis=1)
+        stage.add_rows(passes.size)
+
+    labels = ['+'.join(group for group, bit in zip(groups, mask) if bit) or '(none)' for mask in masks]
+    passes_df = pd.DataFrame(passes, index=pd.Index(labels, name='Coalition'),
+                             columns=pd.Index(breakdown['vote_ids'], name='VoteId'))
+    passes_df.attrs['actual'] = pd.Series(actual, index=breakdown['vote_ids'])
+    pivotality_df = pd.DataFrame(pivotal, index=pd.Index(labels, name='Coalition'), columns=groups)
+    return passes_df, pivotality_df
+
+
+def summarize_coalitions(passes_df, pivotality_df):
+    # One row per coalition: how many roll calls it carries and how many it flips from the recorded outcome
+    actual = passes_df.attrs['actual'].reindex(passes_df.columns).to_numpy()
+    summary_df = pd.DataFrame({
+        'Passed': passes_df.to_numpy().sum(axis=1),
+        'NewlyPassed': (passes_df.to_numpy() & ~actual).sum(axis=1),
+        'NewlyFailed': (~passes_df.to_numpy() & actual).sum(axis=1),
+        'PivotalGroups': (pivotality_df.to_numpy() > 0).sum(axis=1),
+    }, index=passes_df.index)
+    return summary_df.sort_values('Passed', ascending=False)
@@ -0,0 +1,40 @@
+import pandas as pd
+import numpy as np
+
+# First sitting day of each parliamentary term, used when a frame has no EP_ID column
+TERM_STARTS = [(10, '2024-07-16'), (9, '2019-07-02'), (8, '2014-07-01'), (7, '2009-07-14'), (6, '2004-07-20')]
+
+# VoteIds (EP and VoteWatch alike) restart in every term while MepIds persist across terms,
+# so anything that holds votings of more than one term keys them by term_vote_key(term, VoteId).
+
+
+def term_for_date(date):
+    if date is None or pd.isna(date):
+        return 0
+    date = pd.Timestamp(date)
+    for ep_number, start in TERM_STARTS:
+        if date >= pd.Timestamp(start):
+            return ep_number
+    return 0
+
+
+def terms_for(df, date_column='Date'):
+    # Term of every row: the EP_ID column when the frame has one, otherwise from the date (0 if unknown)
+    if 'EP_ID' in df.columns:
+        return df['EP_ID'].fillna(0).astype(int)
+    dates = pd.to_datetime(df[date_column], errors='coerce')
+    terms = np.zeros(len(df), dtype=int)
+    for ep_number, start in sorted(TERM_STARTS, key=lambda term: term[1]):
+        terms[(dates >= pd.Timestamp(start)).to_numpy()] = ep_number
+    return pd.Series(terms, index=df.index)
+
+
+def term_vote_key(term, vote_id):
+    return f"{int(term)}:{vote_id}"
+
+
+def term_window(ep_number):
+    starts = dict(TERM_STARTS)
+    start = pd.Timestamp(starts[ep_number])
+    end = pd.Timestamp(starts[ep_number + 1]) - pd.Timedelta(days=1) if ep_number + 1 in starts else None
+    return start, end
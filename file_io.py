@@ -0,0 +1,30 @@
+import os
+import gzip
+import json
+
+# Files are written next to their target and renamed over it, so readers never see a
+# half-written file and an interrupted run leaves the previous version in place.
+
+
+def write_atomic(path, payload):
+    # payload is bytes or text
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb' if isinstance(payload, bytes) else 'w') as f:
+        f.write(payload)
+    os.replace(temp_path, path)
+
+
+def save_json_gz(path, data):
+    write_atomic(path, gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')))
+
+
+def load_json_gz(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_or_create(cls, path):
+    # Shared by persisted classes with a load(path) classmethod: load_or_create = classmethod(load_or_create)
+    if os.path.exists(path):
+        return cls.load(path)
+    return cls()
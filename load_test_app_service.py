@@ -0,0 +1,116 @@
+import pandas as pd
+import requests
+import os
+import sys
+import time
+import random
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import app_service
+
+# Load test for app_service against a local term dataset, e.g.
+# python load_test_app_service.py --ep 9 --requests 20000 --workers 32
+
+
+def build_local_snapshots(ep_number, snapshot_dir):
+    base_directory = os.path.join("Cleaned_data", f"EP{ep_number}_clean_data")
+    votes_df = pd.read_csv(os.path.join(base_directory, f"votes_EP_{ep_number}.csv"),
+                           usecols=['MepId', 'VoteId', 'Vote'])
+    votings_df = pd.read_csv(os.path.join(base_directory, f"votations_EP_{ep_number}.csv"))
+    mep_df = pd.read_csv(os.path.join(base_directory, f"mep_info_EP_{ep_number}.csv"))
+    app_service.build_snapshots(votes_df, votings_df, mep_df, snapshot_dir)
+    return votes_df['MepId'].dropna().astype(int).unique().tolist()
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/sittings", timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def run_load_test(base_url, mep_ids, n_requests, n_workers):
+    sittings = requests.get(f"{base_url}/sittings").json()
+    voting_ids = []
+    for sitting in sittings[:50]:
+        snapshot = requests.get(f"{base_url}/sittings/{sitting['date']}").json()
+        voting_ids.extend(voting['VoteId'] for voting in snapshot['votings'])
+    etags = {sitting['date']: sitting['etag'] for sitting in sittings}
+
+    # Mix of full sittings, conditional re-downloads, single votings and MEP histories
+    def make_path():
+        choice = random.random()
+        if choice < 0.4:
+            date = random.choice(sittings)['date']
+            return f"/sittings/{date}", {'If-None-Match': etags[date]}
+        if choice < 0.6:
+            return f"/sittings/{random.choice(sittings)['date']}", {}
+        if choice < 0.9:
+            return f"/votings/{random.choice(voting_ids)}", {}
+        start = random.choice(sittings)['date']
+        return f"/meps/{random.choice(mep_ids)}?from={start}", {}
+
+    local = threading.local()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(_):
+        # One keep-alive session per thread
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        path, headers = make_path()
+        start = time.perf_counter()
+        response = local.session.get(base_url + path, headers=headers)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(worker, range(n_requests)))
+    total = time.perf_counter() - start
+
+    latencies = pd.Series(latencies) * 1000
+    print(f"{n_requests} requests in {total:.2f}s ({n_requests / total:.0f} req/s) with {n_workers} workers")
+    print(f"Latency ms: p50={latencies.quantile(0.5):.2f} p95={latencies.quantile(0.95):.2f} "
+          f"p99={latencies.quantile(0.99):.2f} max={latencies.max():.2f}")
+    print(f"Status codes: {statuses}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ep', type=int, default=9)
+    parser.add_argument('--snapshot-dir', help="defaults to Cleaned_data/snapshots/EP{ep}")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--skip-build', action='store_true')
+    args = parser.parse_args()
+    snapshot_dir = args.snapshot_dir or app_service.term_snapshot_dir(args.ep)
+
+    if args.skip_build:
+        mep_df = pd.read_csv(os.path.join("Cleaned_data", f"EP{args.ep}_clean_data", f"mep_info_EP_{args.ep}.csv"))
+        mep_ids = mep_df['MepId'].dropna().astype(int).tolist()
+    else:
+        mep_ids = build_local_snapshots(args.ep, snapshot_dir)
+
+    env = dict(os.environ, EP_SNAPSHOT_DIR=snapshot_dir)
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app_service:app', '--port', str(args.port),
+                               '--log-level', 'warning'], env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_for_server(base_url):
+            print("Server did not start")
+            sys.exit(1)
+        run_load_test(base_url, mep_ids, args.requests, args.workers)
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,194 @@
+import pandas as pd
+import numpy as np
+import os
+import argparse
+import pipeline_metrics as pm
+
+# Streams the per-term cleaned datasets (Cleaned_data/EP{n}_clean_data) into
+# Cleaned_data/Merged_dataset chunk by chunk, replacing the in-memory concat of
+# "Merging dataset.ipynb". Peak memory is bounded by the chunk size.
+#
+#     python merge_datasets.py --terms 6 7 8 9 --chunksize 1000000
+
+VOTES_DTYPES = {'MepId': 'Int32', 'VoteId': 'Int32', 'Vote': 'Int8'}
+VOTATIONS_DTYPES = {'VoteId': 'Int32', 'FinalVote': 'Int8', 'Vote': 'Int8', 'Yes': 'Int16', 'No': 'Int16',
+                    'Abs': 'Int16'}
+MEP_INFO_DTYPES = {'MepId': 'Int32'}
+VOTATIONS_DATES = ['Date']
+MEP_INFO_DATES = ['Start', 'End']
+# Tried in order on the values the previous formats could not parse (older exports use day-first dates)
+DATE_FORMATS = ['ISO8601', '%d.%m.%Y', '%d/%m/%Y']
+
+
+def term_file(ep_number, kind):
+    base_directory = os.path.join("Cleaned_data", f"EP{ep_number}_clean_data")
+    # EP6 was exported as votings_EP_6.csv, later terms as votations_EP_{n}.csv
+    names = {'votes': [f"votes_EP_{ep_number}.csv"],
+             'votations': [f"votations_EP_{ep_number}.csv", f"votings_EP_{ep_number}.csv"],
+             'mep_info': [f"mep_info_EP_{ep_number}.csv"]}[kind]
+    for name in names:
+        path = os.path.join(base_directory, name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No {kind} file for EP{ep_number} in {base_directory}")
+
+
+def merged_columns(paths, usecols=None):
+    # Union of the term headers, in first-seen order, so every chunk is written with the same layout.
+    # A term file that already carries EP_ID does not add a second one; stream_merge sets it from the term.
+    columns = []
+    for path in paths:
+        for col in pd.read_csv(path, nrows=0).columns:
+            if (usecols is None or col in usecols) and col not in columns and col != 'EP_ID':
+                columns.append(col)
+    return columns + ['EP_ID']
+
+
+def parse_dates(values, label):
+    parsed = pd.to_datetime(values, format=DATE_FORMATS[0], errors='coerce')
+    for date_format in DATE_FORMATS[1:]:
+        missing = parsed.isna() & values.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=date_format, errors='coerce')
+    # A value none of the formats match would otherwise end up as a silently blank date
+    unparsed = parsed.isna() & values.notna()
+    if unparsed.any():
+        raise ValueError(f"{label}: {unparsed.sum()} dates in an unknown format, e.g. {values[unparsed].iloc[0]!r}")
+    return parsed
+
+
+def read_chunks(path, columns, dtypes, dates, chunksize):
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [col for col in columns if col in header and col != 'EP_ID']
+    dtype = {col: dt for col, dt in dtypes.items() if col in usecols}
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize):
+        # Dates are parsed exactly once, with an explicit format
+        for col in dates:
+            if col in chunk.columns:
+                chunk[col] = parse_dates(chunk[col], f"{path} {col}")
+        yield chunk
+
+
+class VotesKeyValidator:
+    # (VoteId, MepId) must be unique. Term files are grouped by VoteId, so only the
+    # MEPs of the currently open VoteId and the set of finished VoteIds are kept in memory.
+    def __init__(self, ep_number):
+        self.ep_number = ep_number
+        self.closed_vote_ids = set()
+        self.open_vote_id = None
+        self.open_mep_ids = np.array([], dtype=np.int64)
+
+    def check(self, chunk):
+        vote_ids = chunk['VoteId'].to_numpy(dtype=np.int64, na_value=-1)
+        mep_ids = chunk['MepId'].to_numpy(dtype=np.int64, na_value=-1)
+        if len(vote_ids) == 0:
+            return
+        duplicated = chunk.duplicated(['VoteId', 'MepId'])
+        if duplicated.any():
+            row = chunk[duplicated].iloc[0]
+            raise ValueError(f"EP{self.ep_number}: duplicate vote for VoteId {row['VoteId']}, MepId {row['MepId']}")
+
+        run_starts = np.flatnonzero(np.r_[True, vote_ids[1:] != vote_ids[:-1]])
+        run_vote_ids = vote_ids[run_starts]
+        # The first run may continue the VoteId left open by the previous chunk
+        continues = self.open_vote_id is not None and run_vote_ids[0] == self.open_vote_id
+        if self.open_vote_id is not None and not continues:
+            self.closed_vote_ids.add(self.open_vote_id)
+        unique_runs, counts = np.unique(run_vote_ids, return_counts=True)
+        repeated = unique_runs[counts > 1].tolist() + [v for v in run_vote_ids.tolist() if v in self.closed_vote_ids]
+        if repeated:
+            raise ValueError(f"EP{self.ep_number}: VoteId {repeated[0]} appears in non-contiguous blocks; "
+                             f"votes must be grouped by VoteId")
+
+        first_run_end = run_starts[1] if len(run_starts) > 1 else len(vote_ids)
+        if continues:
+            clashes = np.isin(mep_ids[:first_run_end], self.open_mep_ids)
+            if clashes.any():
+                raise ValueError(f"EP{self.ep_number}: duplicate vote for VoteId {self.open_vote_id}, "
+                                 f"MepId {mep_ids[:first_run_end][clashes][0]}")
+        if continues and len(run_starts) == 1:
+            self.open_mep_ids = np.concatenate([self.open_mep_ids, mep_ids])
+        else:
+            self.open_mep_ids = mep_ids[run_starts[-1]:]
+        self.closed_vote_ids.update(run_vote_ids[:-1].tolist())
+        self.open_vote_id = run_vote_ids[-1]
+
+
+class ColumnKeyValidator:
+    # Small tables (votations, mep_info) keep their full key set
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.seen = set()
+
+    def check(self, chunk):
+        for key in chunk[self.key].to_numpy(dtype=np.int64, na_value=-1).tolist():
+            if key in self.seen:
+                raise ValueError(f"{self.label}: duplicate {self.key} {key}")
+            self.seen.add(key)
+
+
+def stream_merge(kind, terms, temp_path, dtypes, dates, chunksize, make_validator, usecols=None):
+    # Writes the merged table to temp_path; merge_datasets moves it into place once every table succeeded
+    paths = {ep_number: term_file(ep_number, kind) for ep_number in terms}
+    columns = merged_columns(paths.values(), usecols=usecols)
+    pd.DataFrame(columns=columns).to_csv(temp_path, index=False)
+    total_rows = 0
+    for ep_number, path in paths.items():
+        validator = make_validator(ep_number)
+        term_rows = 0
+        with pm.stage('merge_term', table=kind, ep=ep_number) as stage:
+            for chunk in read_chunks(path, columns, dtypes, dates, chunksize):
+                validator.check(chunk)
+                chunk['EP_ID'] = np.int8(ep_number)
+                chunk = chunk.reindex(columns=columns)
+                chunk.to_csv(temp_path, mode='a', header=False, index=False, date_format='%Y-%m-%d')
+                term_rows += len(chunk)
+            stage.add_rows(term_rows)
+        print(f"{kind}: EP{ep_number} merged ({term_rows} rows)")
+        total_rows += term_rows
+    return total_rows
+
+
+def merge_datasets(terms=(6, 7, 8, 9), chunksize=1_000_000, base_directory=None):
+    if base_directory is None:
+        base_directory = os.path.join("Cleaned_data", "Merged_dataset")
+    os.makedirs(base_directory, exist_ok=True)
+
+    # VoteIds restart in every term (see ep_terms) and mep_info lists an MEP once per term they sat in,
+    # so key uniqueness is checked within each term
+    tables = [
+        ('votations', VOTATIONS_DTYPES, VOTATIONS_DATES,
+         lambda ep_number: ColumnKeyValidator('VoteId', f"votations EP{ep_number}"), None),
+        ('mep_info', MEP_INFO_DTYPES, MEP_INFO_DATES,
+         lambda ep_number: ColumnKeyValidator('MepId', f"mep_info EP{ep_number}"), None),
+        ('votes', VOTES_DTYPES, [], VotesKeyValidator, ['MepId', 'VoteId', 'Vote']),
+    ]
+    # All three tables are written to temp files first, so a failure in a later table
+    # does not leave new votations next to old votes
+    written = {}
+    try:
+        for kind, dtypes, dates, make_validator, usecols in tables:
+            temp_path = os.path.join(base_directory, f"{kind}.csv.tmp")
+            written[kind] = temp_path
+            rows = stream_merge(kind, terms, temp_path, dtypes, dates, chunksize, make_validator, usecols=usecols)
+            print(f"{kind}: {rows} rows merged")
+    except Exception:
+        for temp_path in written.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+    for kind, temp_path in written.items():
+        output_path = os.path.join(base_directory, f"{kind}.csv")
+        os.replace(temp_path, output_path)
+        print(f"{kind}: written to {output_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--terms', type=int, nargs='+', default=[6, 7, 8, 9])
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--output', default=os.path.join("Cleaned_data", "Merged_dataset"))
+    args = parser.parse_args()
+    merge_datasets(args.terms, args.chunksize, args.output)
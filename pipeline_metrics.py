@@ -0,0 +1,270 @@
+import os
+import time
+import functools
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from file_io import write_atomic
+
+# Stage-level timing and counters for the ingestion pipeline. Disabled by default;
+# enable with EP_METRICS=1 (EP_METRICS=memory also tracks peak memory) or enable().
+#
+#     with pm.stage('fetch', endpoint='api') as s:
+#         response = requests.get(url)
+#         s.add_bytes(len(response.content))
+#
+# Whole functions can be wrapped with @pm.timed('stage_name'). Results are written with
+# export_openmetrics(path), scraped from serve_metrics(port) or printed with print_run_summary().
+
+METRIC_PREFIX = 'ep_pipeline_stage'
+
+_enabled = False
+_track_memory = False
+_lock = threading.Lock()
+_stats = {}
+_open_records = []
+_run_start = time.time()
+
+
+class NullStage:
+    # Returned while metrics are disabled so instrumented code costs one call
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add_rows(self, n):
+        pass
+
+    def add_bytes(self, n):
+        pass
+
+    def add_retry(self, n=1):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class StageRecord:
+    def __init__(self, name, labels):
+        self.key = (name, tuple(sorted(labels.items())))
+        self.rows = 0
+        self.bytes = 0
+        self.retries = 0
+        self.peak_memory = 0
+        self.start = None
+        self.base_memory = 0
+
+    def __enter__(self):
+        if _track_memory:
+            with _lock:
+                current = fold_memory_peak()
+                self.base_memory = current
+                _open_records.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if _track_memory:
+            with _lock:
+                fold_memory_peak()
+                if self in _open_records:
+                    _open_records.remove(self)
+        record_stage(self, duration, failed=exc_type is not None)
+        return False
+
+    def add_rows(self, n):
+        self.rows += int(n)
+
+    def add_bytes(self, n):
+        self.bytes += int(n)
+
+    def add_retry(self, n=1):
+        self.retries += n
+
+
+def fold_memory_peak():
+    # tracemalloc has a single process-wide peak, so hand it to every open stage before resetting it
+    if not tracemalloc.is_tracing():
+        return 0
+    current, peak = tracemalloc.get_traced_memory()
+    for record in _open_records:
+        record.peak_memory = max(record.peak_memory, peak - record.base_memory)
+    tracemalloc.reset_peak()
+    return current
+
+
+def record_stage(record, duration, failed):
+    with _lock:
+        stats = _stats.get(record.key)
+        if stats is None:
+            stats = {'count': 0, 'errors': 0, 'duration': 0.0, 'max_duration': 0.0, 'rows': 0, 'bytes': 0,
+                     'retries': 0, 'peak_memory': 0}
+            _stats[record.key] = stats
+        stats['count'] += 1
+        stats['errors'] += int(failed)
+        stats['duration'] += duration
+        stats['max_duration'] = max(stats['max_duration'], duration)
+        stats['rows'] += record.rows
+        stats['bytes'] += record.bytes
+        stats['retries'] += record.retries
+        stats['peak_memory'] = max(stats['peak_memory'], record.peak_memory)
+
+
+def stage(name, **labels):
+    if not _enabled:
+        return NULL_STAGE
+    return StageRecord(name, labels)
+
+
+def timed(name, **labels):
+    # Decorator form of stage(); DataFrame results are counted as rows
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with StageRecord(name, labels) as record:
+                result = func(*args, **kwargs)
+                if hasattr(result, 'shape'):
+                    record.add_rows(result.shape[0])
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def enable(track_memory=False):
+    global _enabled, _track_memory
+    _enabled = True
+    _track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled, _track_memory
+    _enabled = False
+    if _track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _track_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    global _run_start
+    with _lock:
+        _stats.clear()
+        _run_start = time.time()
+
+
+def get_stats():
+    with _lock:
+        return {key: dict(stats) for key, stats in _stats.items()}
+
+
+def format_labels(key):
+    name, labels = key
+    pairs = [('stage', name)] + list(labels)
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def export_openmetrics(path=None):
+    stats = get_stats()
+    keys = sorted(stats)
+    lines = [
+        f"# TYPE {METRIC_PREFIX}_duration_seconds summary",
+        f"# UNIT {METRIC_PREFIX}_duration_seconds seconds",
+        f"# HELP {METRIC_PREFIX}_duration_seconds Wall time spent in a pipeline stage.",
+    ]
+    for key in keys:
+        lines.append(f"{METRIC_PREFIX}_duration_seconds_count{format_labels(key)} {stats[key]['count']}")
+        lines.append(f"{METRIC_PREFIX}_duration_seconds_sum{format_labels(key)} {stats[key]['duration']:.6f}")
+    counters = [('rows', 'Rows produced by a pipeline stage.'),
+                ('bytes', 'Bytes transferred by a pipeline stage.'),
+                ('retries', 'Retries performed by a pipeline stage.'),
+                ('errors', 'Pipeline stage runs that raised an exception.')]
+    for field, help_text in counters:
+        lines.append(f"# TYPE {METRIC_PREFIX}_{field} counter")
+        lines.append(f"# HELP {METRIC_PREFIX}_{field} {help_text}")
+        for key in keys:
+            lines.append(f"{METRIC_PREFIX}_{field}_total{format_labels(key)} {stats[key][field]}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_max_duration_seconds gauge")
+    lines.append(f"# UNIT {METRIC_PREFIX}_max_duration_seconds seconds")
+    lines.append(f"# HELP {METRIC_PREFIX}_max_duration_seconds Slowest single run of a pipeline stage.")
+    for key in keys:
+        lines.append(f"{METRIC_PREFIX}_max_duration_seconds{format_labels(key)} {stats[key]['max_duration']:.6f}")
+    if _track_memory:
+        lines.append(f"# TYPE {METRIC_PREFIX}_peak_memory_bytes gauge")
+        lines.append(f"# UNIT {METRIC_PREFIX}_peak_memory_bytes bytes")
+        lines.append(f"# HELP {METRIC_PREFIX}_peak_memory_bytes Peak Python heap growth while the stage was running.")
+        for key in keys:
+            lines.append(f"{METRIC_PREFIX}_peak_memory_bytes{format_labels(key)} {stats[key]['peak_memory']}")
+    lines.append("# EOF")
+    text = '\n'.join(lines) + '\n'
+    if path is not None:
+        write_atomic(path, text)
+    return text
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = export_openmetrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=9464):
+    # Scrape endpoint on http://localhost:{port}/metrics, served from a daemon thread
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def format_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+
+def print_run_summary():
+    # Per-run profile, slowest stages first
+    stats = get_stats()
+    elapsed = time.time() - _run_start
+    print(f"Pipeline run summary ({elapsed:.1f}s wall time)")
+    header = f"{'stage':<40}{'calls':>7}{'errors':>7}{'total s':>10}{'max s':>9}{'rows':>11}{'bytes':>10}{'retries':>9}"
+    if _track_memory:
+        header += f"{'peak mem':>10}"
+    print(header)
+    for key, values in sorted(stats.items(), key=lambda item: -item[1]['duration']):
+        label = format_labels(key)[1:-1].replace('"', '')
+        line = (f"{label[:39]:<40}{values['count']:>7}{values['errors']:>7}{values['duration']:>10.2f}"
+                f"{values['max_duration']:>9.2f}{values['rows']:>11}{format_bytes(values['bytes']):>10}"
+                f"{values['retries']:>9}")
+        if _track_memory:
+            line += f"{format_bytes(values['peak_memory']):>10}"
+        print(line)
+    return stats
+
+
+if os.environ.get('EP_METRICS'):
+    enable(track_memory=os.environ.get('EP_METRICS') == 'memory')
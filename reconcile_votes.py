@@ -0,0 +1,85 @@
+import pandas as pd
+import numpy as np
+import os
+import argparse
+import pipeline_metrics as pm
+
+# Checks the official tallies of each voting (Yes/No/Abs, from number_of_votes_favor/
+# against/abstention) against the per-MEP outcomes of get_votes_for_database
+# (codes 1/2/3) and reports the votings where they disagree.
+#
+#     python reconcile_votes.py --ep 9
+
+TALLY_COLUMNS = ['Yes', 'No', 'Abs']
+DERIVED_COLUMNS = ['DerivedYes', 'DerivedNo', 'DerivedAbs']
+DIFF_COLUMNS = ['DiffYes', 'DiffNo', 'DiffAbs']
+
+
+def count_votes_by_voting(votes_df):
+    # Per-VoteId counts of codes 1/2/3 in one bincount over all rows
+    vote_ids = votes_df['VoteId'].to_numpy(dtype=np.int64, na_value=-1)
+    codes = votes_df['Vote'].to_numpy(dtype=np.int64, na_value=-1)
+    unique_ids, positions = np.unique(vote_ids, return_inverse=True)
+    counted = (codes >= 1) & (codes <= 3)
+    counts = np.bincount(positions[counted] * 3 + (codes[counted] - 1), minlength=len(unique_ids) * 3)
+    counts_df = pd.DataFrame(counts.reshape(-1, 3), columns=DERIVED_COLUMNS)
+    counts_df.insert(0, 'VoteId', unique_ids)
+    return counts_df[counts_df['VoteId'] != -1]
+
+
+def reconcile_vote_counts(votes_df, votings_df, tolerance=0):
+    with pm.stage('reconcile_votes') as stage:
+        counts_df = count_votes_by_voting(votes_df)
+        votings = votings_df.copy()
+        votings['VoteId'] = votings['VoteId'].astype('Int64')
+        counts_df['VoteId'] = counts_df['VoteId'].astype('Int64')
+        report = pd.merge(votings, counts_df, on='VoteId', how='outer', indicator=True)
+
+        official = report[TALLY_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+        derived = report[DERIVED_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+        diff = derived - official
+        report[DIFF_COLUMNS] = diff
+
+        issue = np.full(len(report), None, dtype=object)
+        mismatch = np.nan_to_num(np.abs(diff), nan=0) > tolerance
+        issue[mismatch.any(axis=1)] = 'count_mismatch'
+        issue[np.isnan(official).any(axis=1)] = 'missing_tally'
+        issue[(report['_merge'] == 'left_only').to_numpy()] = 'no_votes'
+        issue[(report['_merge'] == 'right_only').to_numpy()] = 'no_voting'
+        report['Issue'] = issue
+        report = report[report['Issue'].notna()]
+
+        columns = [col for col in ['VoteId', 'Date', 'Title', 'TypeOfVote'] if col in report.columns]
+        report = report[columns + TALLY_COLUMNS + DERIVED_COLUMNS + DIFF_COLUMNS + ['Issue']]
+        for col in TALLY_COLUMNS + DERIVED_COLUMNS + DIFF_COLUMNS:
+            report[col] = report[col].astype('Int64')
+        stage.add_rows(len(votes_df))
+    return report.sort_values('VoteId').reset_index(drop=True)
+
+
+def export_mismatch_report(report, path):
+    report.to_csv(path, index=False)
+    if report.empty:
+        print("All votings reconcile with the per-MEP votes.")
+    else:
+        print(f"{len(report)} votings do not reconcile; report written to {path}")
+        print(report['Issue'].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ep', type=int, default=9)
+    parser.add_argument('--tolerance', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    base_directory = os.path.join("Cleaned_data", f"EP{args.ep}_clean_data")
+    votes_df = pd.read_csv(os.path.join(base_directory, f"votes_EP_{args.ep}.csv"), usecols=['VoteId', 'Vote'],
+                           dtype={'VoteId': 'Int64', 'Vote': 'Int8'})
+    votings_path = os.path.join(base_directory, f"votations_EP_{args.ep}.csv")
+    if not os.path.exists(votings_path):
+        votings_path = os.path.join(base_directory, f"votings_EP_{args.ep}.csv")
+    votings_df = pd.read_csv(votings_path)
+    report = reconcile_vote_counts(votes_df, votings_df, tolerance=args.tolerance)
+    output = args.output or os.path.join(base_directory, f"reconciliation_EP_{args.ep}.csv")
+    export_mismatch_report(report, output)
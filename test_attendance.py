@@ -0,0 +1,73 @@
+import pandas as pd
+import numpy as np
+import pytest
+from attendance import AttendanceAccumulator
+
+
+def make_term():
+    # Two sittings (January: VoteIds 1-2, February: VoteId 3) in one votings frame
+    votings_df = pd.DataFrame({
+        'VoteId': [1, 2, 3],
+        'Date': ['2020-01-15', '2020-01-15', '2020-02-12'],
+        'PolicyArea': ['Budgets', 'Agriculture', 'Budgets'],
+    })
+    votes_df = pd.DataFrame({
+        'VoteId': [1, 1, 1, 2, 2, 2, 3, 3, 3],
+        'MepId': [10, 11, 12, 10, 11, 12, 10, 11, 12],
+        'Vote': [1, 4, 5, 2, 4, 0, 3, 1, 4],
+    })
+    return votes_df, votings_df
+
+
+def rates(accumulator, **window):
+    return accumulator.get_rates_df(**window).set_index('MepId')
+
+
+def test_sittings_ingested_one_at_a_time_against_shared_votings():
+    votes_df, votings_df = make_term()
+    accumulator = AttendanceAccumulator()
+
+    assert accumulator.add_sitting(votes_df[votes_df['VoteId'] < 3], votings_df) == 2
+    assert accumulator.add_sitting(votes_df[votes_df['VoteId'] == 3], votings_df) == 1
+    assert accumulator.add_sitting(votes_df, votings_df) == 0
+    assert accumulator.ingested_keys == {'9:1', '9:2', '9:3'}
+
+    february = rates(accumulator, start='2020-02-01', end='2020-02-29')
+    assert february.loc[10, 'Voted'] == 1
+    assert february.loc[12, 'Excused'] == 1
+
+    at_once = AttendanceAccumulator()
+    at_once.add_sitting(votes_df, votings_df)
+    pd.testing.assert_frame_equal(rates(accumulator), rates(at_once))
+    pd.testing.assert_frame_equal(rates(accumulator, policy_area='Budgets'), rates(at_once, policy_area='Budgets'))
+
+
+def test_sittings_ingested_out_of_order_match_in_order():
+    votes_df, votings_df = make_term()
+    in_order = AttendanceAccumulator()
+    out_of_order = AttendanceAccumulator()
+    for vote_ids in [[1, 2], [3]]:
+        in_order.add_sitting(votes_df[votes_df['VoteId'].isin(vote_ids)], votings_df)
+    for vote_ids in [[3], [1, 2]]:
+        out_of_order.add_sitting(votes_df[votes_df['VoteId'].isin(vote_ids)], votings_df)
+
+    pd.testing.assert_frame_equal(rates(in_order), rates(out_of_order))
+    assert out_of_order.get_counts(10, start='2020-01-01', end='2020-01-31') == [0, 1, 1, 0, 0, 0]
+
+
+def test_same_vote_id_in_two_terms():
+    votes_df, votings_df = make_term()
+    later = votings_df.assign(Date=['2010-01-13', '2010-01-13', '2010-02-10'])
+    accumulator = AttendanceAccumulator()
+    accumulator.add_sitting(votes_df, votings_df)
+
+    assert accumulator.add_sitting(votes_df, later) == 3
+    assert accumulator.get_counts(11, end='2014-06-30') == [0, 1, 0, 0, 2, 0]
+
+
+def test_multi_term_votings_need_term_on_votes():
+    votes_df, votings_df = make_term()
+    votings_df = pd.concat([votings_df.assign(EP_ID=9), votings_df.assign(EP_ID=7)], ignore_index=True)
+    with pytest.raises(ValueError, match="EP_ID"):
+        AttendanceAccumulator().add_sitting(votes_df, votings_df)
+    assert AttendanceAccumulator().add_sitting(votes_df.assign(EP_ID=np.int8(7)), votings_df) == 3
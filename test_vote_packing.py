@@ -0,0 +1,91 @@
+import pandas as pd
+import numpy as np
+import pytest
+from vote_packing import encode_votes, write_packed_votes, PackedVotes, MISSING_CODE
+
+
+def make_votes(n_votes=40, n_meps=11, seed=0):
+    rng = np.random.default_rng(seed)
+    votes_df = pd.DataFrame({
+        'VoteId': np.repeat(np.arange(100, 100 + n_votes), n_meps),
+        'MepId': np.tile(np.arange(5000, 5000 + n_meps), n_votes),
+        'Vote': rng.integers(0, 6, n_votes * n_meps),
+    }).astype('Int64')
+    # Cells without a record: dropped rows and missing votes are both stored as code 7
+    votes_df = votes_df.drop(index=rng.choice(len(votes_df), 25, replace=False))
+    votes_df.loc[votes_df.index[:5], 'Vote'] = pd.NA
+    return votes_df.reset_index(drop=True)
+
+
+def expected_cells(votes_df):
+    return votes_df.dropna(subset=['Vote']).sort_values(['VoteId', 'MepId']).reset_index(drop=True)
+
+
+def test_round_trip_with_missing_cells():
+    votes_df = make_votes()
+    mep_order = np.arange(5000, 5011)[::-1]
+    packed = PackedVotes(encode_votes(votes_df, mep_order=mep_order, ep_number=9))
+
+    assert packed.ep_number == 9
+    assert packed.mep_ids.tolist() == mep_order.tolist()
+    decoded = packed.to_votes_df().sort_values(['VoteId', 'MepId']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(decoded, expected_cells(votes_df))
+
+
+@pytest.mark.parametrize('position', [0, 2, 5, 10])
+def test_get_mep_and_rollcall_at_byte_boundaries(position):
+    # 3-bit cells straddle bytes at positions 2 (bits 6-8) and 5 (bits 15-17)
+    votes_df = make_votes()
+    packed = PackedVotes(encode_votes(votes_df, mep_order=np.arange(5000, 5011), ep_number=9))
+    mep_id = 5000 + position
+
+    recorded = votes_df[votes_df['MepId'] == mep_id].set_index('VoteId')['Vote']
+    mep_votes = packed.get_mep(mep_id)
+    assert mep_votes.reindex(recorded.index).equals(recorded.rename('Vote').rename_axis('VoteId'))
+    assert mep_votes.drop(recorded.index).isna().all()
+
+    for vote_id in [100, 117, 139]:
+        rollcall = packed.get_rollcall(vote_id)
+        recorded = votes_df[votes_df['VoteId'] == vote_id].set_index('MepId')['Vote']
+        assert rollcall.reindex(recorded.index).equals(recorded.rename('Vote').rename_axis('MepId'))
+        assert rollcall.drop(recorded.index).isna().all()
+
+
+def test_open_memory_maps_file(tmp_path):
+    votes_df = make_votes(n_votes=300, n_meps=705, seed=1)
+    path = str(tmp_path / 'votes.epv')
+    size = write_packed_votes(path, votes_df, mep_order=np.arange(5000, 5705), ep_number=10)
+
+    packed = PackedVotes.open(path)
+    base = packed.rows
+    while isinstance(base, np.ndarray) and not isinstance(base, np.memmap):
+        base = base.base
+    assert isinstance(base, np.memmap)
+    assert size == (tmp_path / 'votes.epv').stat().st_size
+    in_memory = PackedVotes(open(path, 'rb').read())
+    assert packed.get_mep(5704).equals(in_memory.get_mep(5704))
+    assert packed.get_rollcall(250).equals(in_memory.get_rollcall(250))
+    decoded = packed.to_votes_df().sort_values(['VoteId', 'MepId']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(decoded, expected_cells(votes_df))
+
+
+def test_unknown_mep_in_order_is_rejected():
+    votes_df = make_votes()
+    with pytest.raises(ValueError, match="MepId 5010 is not in the MEP order"):
+        encode_votes(votes_df, mep_order=np.arange(5000, 5010), ep_number=9)
+
+
+def test_unknown_ids_on_read():
+    packed = PackedVotes(encode_votes(make_votes(), mep_order=np.arange(5000, 5011), ep_number=9))
+    with pytest.raises(KeyError):
+        packed.get_mep(1)
+    with pytest.raises(KeyError):
+        packed.get_rollcall(1)
+
+
+@pytest.mark.parametrize('code', [6, MISSING_CODE, -1])
+def test_bad_vote_code_is_rejected(code):
+    votes_df = make_votes()
+    votes_df.loc[7, 'Vote'] = code
+    with pytest.raises(ValueError, match="Vote codes must be between 0 and 5"):
+        encode_votes(votes_df, mep_order=np.arange(5000, 5011), ep_number=9)
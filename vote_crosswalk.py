@@ -0,0 +1,165 @@
+import pandas as pd
+import numpy as np
+import os
+import argparse
+import pipeline_metrics as pm
+from ep_terms import terms_for
+
+# Links VoteWatch roll calls (historical EP6-EP9 votations) to EP Open Data voting ids
+# (voting_id from get_xml/get_api, VoteId in get_votings_for_database) and persists the
+# crosswalk, instead of ad-hoc id arithmetic such as extract_voteid.
+#
+# Both sides are votings frames (VoteId, Date, Title, AmNo, Yes, No, Abs). Rows are
+# matched in passes from strictest to loosest; each pass is a hash join on a blocking
+# key among the rows still unmatched, and only keys that are unique on both sides are
+# linked. A last pass pairs the remaining rows of the same sitting by nearest tallies.
+#
+#     python vote_crosswalk.py Cleaned_data/EP9_clean_data/votations_EP_9.csv votings_api_EP_9.csv
+
+MATCH_PASSES = [
+    ('date_tallies_amno', ['Date', 'Yes', 'No', 'Abs', 'AmNo']),
+    ('date_tallies', ['Date', 'Yes', 'No', 'Abs']),
+    ('date_title_amno', ['Date', 'Title', 'AmNo']),
+]
+EMPTY_AMENDMENTS = ['', '0', '-', 'nan', 'none', '<na>']
+
+
+def normalize_text(series):
+    # Case-folded ASCII words, so accents, punctuation and spacing do not break keys
+    return (series.fillna('').astype(str).str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip())
+
+
+def prepare_votings(votings_df):
+    keys = pd.DataFrame()
+    keys['VoteId'] = votings_df['VoteId'].astype(str).values
+    keys['Date'] = pd.to_datetime(votings_df['Date'], errors='coerce').dt.strftime('%Y-%m-%d').values
+    keys['Title'] = normalize_text(votings_df['Title']).values
+    if 'AmNo' in votings_df.columns:
+        amendments = normalize_text(votings_df['AmNo'])
+    else:
+        amendments = pd.Series('', index=votings_df.index)
+    keys['AmNo'] = amendments.where(~amendments.isin(EMPTY_AMENDMENTS), '').values
+    for col in ['Yes', 'No', 'Abs']:
+        keys[col] = pd.to_numeric(votings_df[col], errors='coerce').fillna(-1).astype(np.int64).values
+    return keys
+
+
+def usable_rows(keys, columns):
+    # Rows whose blocking key has every component present
+    mask = keys['Date'].notna()
+    for col in columns:
+        if col in ['Yes', 'No', 'Abs']:
+            mask &= keys[col] >= 0
+        elif col in ['Title', 'AmNo']:
+            mask &= keys[col] != ''
+    return keys[mask]
+
+
+def match_on_key(left, right, columns):
+    left = usable_rows(left, columns)
+    right = usable_rows(right, columns)
+    if left.empty or right.empty:
+        return pd.DataFrame(columns=['VoteWatchId', 'VotingId'])
+    left = pd.DataFrame({'VoteWatchId': left['VoteId'].values,
+                         'key': pd.util.hash_pandas_object(left[columns], index=False).values})
+    right = pd.DataFrame({'VotingId': right['VoteId'].values,
+                          'key': pd.util.hash_pandas_object(right[columns], index=False).values})
+    # Ambiguous keys are left for later passes rather than guessed
+    left = left[~left['key'].duplicated(keep=False)]
+    right = right[~right['key'].duplicated(keep=False)]
+    return pd.merge(left, right, on='key')[['VoteWatchId', 'VotingId']]
+
+
+def match_nearest_tallies(left, right, max_tally_diff):
+    left = usable_rows(left, ['Yes', 'No', 'Abs'])
+    right = usable_rows(right, ['Yes', 'No', 'Abs'])
+    matches = []
+    right_by_date = dict(tuple(right.groupby('Date')))
+    for date, left_block in left.groupby('Date'):
+        right_block = right_by_date.get(date)
+        if right_block is None:
+            continue
+        left_tallies = left_block[['Yes', 'No', 'Abs']].to_numpy()
+        right_tallies = right_block[['Yes', 'No', 'Abs']].to_numpy()
+        distance = np.abs(left_tallies[:, None, :] - right_tallies[None, :, :]).sum(axis=2)
+        # Different amendment numbers on both sides can never be the same roll call
+        left_amendments = left_block['AmNo'].to_numpy()
+        right_amendments = right_block['AmNo'].to_numpy()
+        conflict = ((left_amendments[:, None] != right_amendments[None, :]) & (left_amendments[:, None] != '')
+                    & (right_amendments[None, :] != ''))
+        distance = np.where(conflict, max_tally_diff + 1, distance)
+        best_right = distance.argmin(axis=1)
+        best_left = distance.argmin(axis=0)
+        for i, j in enumerate(best_right):
+            if best_left[j] == i and distance[i, j] <= max_tally_diff:
+                matches.append((left_block['VoteId'].iat[i], right_block['VoteId'].iat[j], int(distance[i, j])))
+    return pd.DataFrame(matches, columns=['VoteWatchId', 'VotingId', 'TallyDiff'])
+
+
+def build_crosswalk(votewatch_df, api_votings_df, max_tally_diff=5):
+    # Each term is linked on its own, and every link carries its term (see ep_terms)
+    terms = terms_for(votewatch_df)
+    if terms.nunique() > 1:
+        return pd.concat([build_crosswalk(votewatch_df[terms == term], api_votings_df, max_tally_diff)
+                          for term in sorted(terms.unique())], ignore_index=True)
+    with pm.stage('build_crosswalk') as stage:
+        left = prepare_votings(votewatch_df)
+        right = prepare_votings(api_votings_df)
+        dates = dict(zip(left['VoteId'], left['Date']))
+        crosswalks = []
+        for pass_name, columns in MATCH_PASSES:
+            matches = match_on_key(left, right, columns)
+            matches['TallyDiff'] = 0
+            matches['MatchPass'] = pass_name
+            crosswalks.append(matches)
+            left = left[~left['VoteId'].isin(matches['VoteWatchId'])]
+            right = right[~right['VoteId'].isin(matches['VotingId'])]
+        matches = match_nearest_tallies(left, right, max_tally_diff)
+        matches['MatchPass'] = 'date_nearest_tallies'
+        crosswalks.append(matches)
+
+        crosswalk = pd.concat(crosswalks, ignore_index=True)
+        crosswalk.insert(0, 'Date', crosswalk['VoteWatchId'].map(dates))
+        crosswalk.insert(0, 'EP', pd.array([terms.iloc[0] if len(terms) else 0] * len(crosswalk), dtype='Int64'))
+        crosswalk['TallyDiff'] = crosswalk['TallyDiff'].astype('Int64')
+        stage.add_rows(len(crosswalk))
+    print(f"{len(crosswalk)} of {len(votewatch_df)} VoteWatch roll calls linked "
+          f"({crosswalk['MatchPass'].value_counts().to_dict()})")
+    return crosswalk.sort_values(['Date', 'VoteWatchId']).reset_index(drop=True)
+
+
+def save_crosswalk(crosswalk, path):
+    # Later runs only add links for roll calls that were not linked before, per term
+    if os.path.exists(path):
+        existing = load_crosswalk(path)
+        linked_votewatch = pd.MultiIndex.from_frame(existing[['EP', 'VoteWatchId']])
+        linked_votings = pd.MultiIndex.from_frame(existing[['EP', 'VotingId']])
+        new_links = crosswalk[~pd.MultiIndex.from_frame(crosswalk[['EP', 'VoteWatchId']]).isin(linked_votewatch)
+                              & ~pd.MultiIndex.from_frame(crosswalk[['EP', 'VotingId']]).isin(linked_votings)]
+        crosswalk = pd.concat([existing, new_links], ignore_index=True)
+    crosswalk.to_csv(path, index=False)
+    return crosswalk
+
+
+def load_crosswalk(path):
+    crosswalk = pd.read_csv(path, dtype={'VoteWatchId': str, 'VotingId': str})
+    if 'EP' not in crosswalk.columns:
+        crosswalk.insert(0, 'EP', terms_for(crosswalk))
+    crosswalk['EP'] = crosswalk['EP'].astype('Int64')
+    return crosswalk
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('votewatch_votings')
+    parser.add_argument('api_votings')
+    parser.add_argument('--max-tally-diff', type=int, default=5)
+    parser.add_argument('--output', default=os.path.join("Cleaned_data", "crosswalk_votewatch_ep.csv"))
+    args = parser.parse_args()
+
+    votewatch_df = pd.read_csv(args.votewatch_votings)
+    api_votings_df = pd.read_csv(args.api_votings)
+    crosswalk = build_crosswalk(votewatch_df, api_votings_df, max_tally_diff=args.max_tally_diff)
+    save_crosswalk(crosswalk, args.output)
+    print(f"Crosswalk written to {args.output}")
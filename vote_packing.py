@@ -0,0 +1,158 @@
+import pandas as pd
+import numpy as np
+import os
+import struct
+import argparse
+import pipeline_metrics as pm
+
+# Compact vote files: every MEP x roll call cell (codes 0-5 from categorize_vote_app,
+# 7 = no record) is packed into 3 bits, one fixed-width row per roll call, in a fixed
+# MEP order per term. The header indexes the MEP ids and the roll call ids, so one
+# roll call is a single row read and one MEP is a strided read of the same few bytes in
+# every row; neither needs the rest of the file to be decoded.
+#
+# Layout (little endian):
+#     magic b'EPVB' | version u8 | ep_number u8 | reserved u16 | n_meps u32 | n_rollcalls u32
+#     MEP ids int64[n_meps] | VoteIds int64[n_rollcalls] | rows uint8[n_rollcalls, row_bytes]
+
+MAGIC = b'EPVB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHII')
+BITS = 3
+MISSING_CODE = 7
+BIT_WEIGHTS = np.array([4, 2, 1], dtype=np.uint8)
+
+
+def row_bytes(n_meps):
+    return (n_meps * BITS + 7) // 8
+
+
+def pack_codes(codes):
+    # codes: uint8 array (n_rollcalls, n_meps) -> packed rows (n_rollcalls, row_bytes)
+    bits = (codes[:, :, None] >> np.array([2, 1, 0], dtype=np.uint8)) & 1
+    return np.packbits(bits.reshape(codes.shape[0], -1), axis=1)
+
+
+def unpack_codes(rows, n_meps):
+    bits = np.unpackbits(rows, axis=1, count=n_meps * BITS).reshape(rows.shape[0], n_meps, BITS)
+    return bits @ BIT_WEIGHTS
+
+
+def encode_votes(votes_df, mep_order=None, ep_number=0):
+    # votes_df is in long format (VoteId, MepId, Vote); mep_order fixes the MEP columns for the term
+    # (e.g. the MepId column of mep_info) so files of the same term line up
+    with pm.stage('pack_votes') as stage:
+        payload = pack_votes_frame(votes_df, mep_order, ep_number)
+        stage.add_rows(len(votes_df))
+        stage.add_bytes(len(payload))
+    return payload
+
+
+def pack_votes_frame(votes_df, mep_order, ep_number):
+    vote_ids = np.sort(votes_df['VoteId'].dropna().astype(np.int64).unique())
+    if mep_order is None:
+        mep_ids = np.sort(votes_df['MepId'].dropna().astype(np.int64).unique())
+    else:
+        mep_ids = pd.Index(pd.Series(mep_order).astype(np.int64)).unique().to_numpy()
+    votes = votes_df.dropna(subset=['VoteId', 'MepId'])
+    vote_index = np.searchsorted(vote_ids, votes['VoteId'].to_numpy(dtype=np.int64))
+    mep_positions = pd.Index(mep_ids).get_indexer(votes['MepId'].to_numpy(dtype=np.int64))
+    if (mep_positions < 0).any():
+        missing = votes['MepId'].to_numpy(dtype=np.int64)[mep_positions < 0][0]
+        raise ValueError(f"MepId {missing} is not in the MEP order")
+    values = votes['Vote'].to_numpy(dtype=np.float64, na_value=np.nan)
+    if np.any((values < 0) | (values > 5)):
+        raise ValueError("Vote codes must be between 0 and 5")
+
+    codes = np.full((len(vote_ids), len(mep_ids)), MISSING_CODE, dtype=np.uint8)
+    present = ~np.isnan(values)
+    codes[vote_index[present], mep_positions[present]] = values[present].astype(np.uint8)
+
+    header = HEADER.pack(MAGIC, VERSION, ep_number, 0, len(mep_ids), len(vote_ids))
+    return b''.join([header, mep_ids.astype('<i8').tobytes(), vote_ids.astype('<i8').tobytes(),
+                     pack_codes(codes).tobytes()])
+
+
+def write_packed_votes(path, votes_df, mep_order=None, ep_number=0):
+    payload = encode_votes(votes_df, mep_order=mep_order, ep_number=ep_number)
+    with open(path, 'wb') as f:
+        f.write(payload)
+    return len(payload)
+
+
+class PackedVotes:
+    # Reads from bytes or, via open(), from a memory-mapped file so only the touched rows are loaded
+    def __init__(self, buffer):
+        magic, version, self.ep_number, _, n_meps, n_rollcalls = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a packed votes file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported packed votes version {version}")
+        offset = HEADER.size
+        self.mep_ids = np.frombuffer(buffer, dtype='<i8', count=n_meps, offset=offset)
+        offset += 8 * n_meps
+        self.vote_ids = np.frombuffer(buffer, dtype='<i8', count=n_rollcalls, offset=offset)
+        offset += 8 * n_rollcalls
+        self.rows = np.frombuffer(buffer, dtype=np.uint8, count=n_rollcalls * row_bytes(n_meps),
+                                  offset=offset).reshape(n_rollcalls, row_bytes(n_meps))
+        self.mep_positions = {mep_id: i for i, mep_id in enumerate(self.mep_ids.tolist())}
+        self.vote_positions = {vote_id: i for i, vote_id in enumerate(self.vote_ids.tolist())}
+
+    @classmethod
+    def open(cls, path):
+        return cls(np.memmap(path, dtype=np.uint8, mode='r'))
+
+    @staticmethod
+    def to_votes(codes):
+        votes = pd.Series(codes, dtype='Int64')
+        return votes.mask(votes == MISSING_CODE)
+
+    def get_rollcall(self, vote_id):
+        position = self.vote_positions.get(int(vote_id))
+        if position is None:
+            raise KeyError(f"VoteId {vote_id} not in file")
+        codes = unpack_codes(self.rows[position:position + 1], len(self.mep_ids))[0]
+        votes = self.to_votes(codes)
+        votes.index = pd.Index(self.mep_ids, name='MepId')
+        return votes.rename('Vote')
+
+    def get_mep(self, mep_id):
+        position = self.mep_positions.get(int(mep_id))
+        if position is None:
+            raise KeyError(f"MepId {mep_id} not in file")
+        # The MEP's 3 bits sit in the same one or two bytes of every row
+        first_bit = position * BITS
+        first_byte = first_bit // 8
+        last_byte = (first_bit + BITS - 1) // 8
+        bits = np.unpackbits(self.rows[:, first_byte:last_byte + 1], axis=1)
+        shift = first_bit - first_byte * 8
+        codes = bits[:, shift:shift + BITS] @ BIT_WEIGHTS
+        votes = self.to_votes(codes)
+        votes.index = pd.Index(self.vote_ids, name='VoteId')
+        return votes.rename('Vote')
+
+    def to_votes_df(self):
+        # Full decode back to the long (VoteId, MepId, Vote) format, skipping cells without a record
+        codes = unpack_codes(np.asarray(self.rows), len(self.mep_ids))
+        vote_index, mep_index = np.nonzero(codes != MISSING_CODE)
+        return pd.DataFrame({
+            'VoteId': pd.array(self.vote_ids[vote_index], dtype='Int64'),
+            'MepId': pd.array(self.mep_ids[mep_index], dtype='Int64'),
+            'Vote': pd.array(codes[vote_index, mep_index], dtype='Int64'),
+        })
+
+
+if __name__ == '__main__':
+    # Packs a cleaned term's votes file, e.g. python vote_packing.py 9
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ep_number', type=int)
+    parser.add_argument('--base-directory', default="Cleaned_data")
+    args = parser.parse_args()
+
+    term_directory = os.path.join(args.base_directory, f"EP{args.ep_number}_clean_data")
+    votes_path = os.path.join(term_directory, f"votes_EP_{args.ep_number}.csv")
+    mep_info_df = pd.read_csv(os.path.join(term_directory, f"mep_info_EP_{args.ep_number}.csv"))
+    votes_df = pd.read_csv(votes_path, usecols=['VoteId', 'MepId', 'Vote'])
+    packed_path = os.path.splitext(votes_path)[0] + '.epv'
+    size = write_packed_votes(packed_path, votes_df, mep_order=mep_info_df['MepId'], ep_number=args.ep_number)
+    print(f"{packed_path} written: {size} bytes ({os.path.getsize(votes_path) / size:.1f}x smaller than the CSV)")
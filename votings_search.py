@@ -0,0 +1,246 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+import bisect
+import unicodedata
+import argparse
+from file_io import save_json_gz, load_json_gz, load_or_create
+from ep_terms import terms_for, term_vote_key
+
+# Inverted index over votings metadata (as produced by get_votings_for_database and the
+# cleaned votations files), replacing str.contains scans. Documents are added
+# incrementally as votings are ingested, the index is persisted as gzipped JSON, and
+# queries are ranked with BM25 and can be filtered by date window and EP term.
+#
+#     index = VotingsSearchIndex.load_or_create(path)
+#     index.add_votings(votings_df)
+#     index.save(path)
+#     index.search("gas storag", start='2022-01-01', term=9)
+
+FIELD_WEIGHTS = {'Title': 3, 'Subject': 2, 'Rapporteur': 2, 'CommitteeResponsabile': 1, 'Procedure': 1}
+# get_votings_for_database casts missing fields to the strings 'None' and 'nan'
+IGNORED_TOKENS = {'none', 'nan', 'nat'}
+MISSING_DATE = -(2 ** 31)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return [token for token in re.findall(r'[a-z0-9]+', text) if token not in IGNORED_TOKENS]
+
+
+def date_to_day(date):
+    if date is None or pd.isna(date):
+        return MISSING_DATE
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64))
+
+
+class VotingsSearchIndex:
+    def __init__(self):
+        self.vote_ids = []
+        self.days = []
+        self.terms = []
+        self.lengths = []
+        self.alive = []
+        self.doc_by_key = {}
+        self.postings = {}
+        self.array_cache = {}
+        self.doc_arrays = None
+        self.sorted_tokens = None
+
+    def add_votings(self, votings_df):
+        # Re-adding a VoteId of the same term replaces its previous document
+        fields = [field for field in FIELD_WEIGHTS if field in votings_df.columns]
+        dates = pd.to_datetime(votings_df['Date'], errors='coerce')
+        terms = terms_for(votings_df)
+        added = 0
+        for vote_id, date, term, values in zip(votings_df['VoteId'], dates, terms,
+                                               votings_df[fields].itertuples(index=False, name=None)):
+            if pd.isna(vote_id):
+                continue
+            vote_id = str(vote_id)
+            term = int(term)
+            weights = {}
+            for field, value in zip(fields, values):
+                for token in tokenize(value):
+                    weights[token] = weights.get(token, 0) + FIELD_WEIGHTS[field]
+            self.remove(vote_id, term)
+            doc = len(self.vote_ids)
+            self.vote_ids.append(vote_id)
+            self.days.append(date_to_day(date))
+            self.terms.append(term)
+            self.lengths.append(sum(weights.values()))
+            self.alive.append(True)
+            self.doc_by_key[term_vote_key(term, vote_id)] = doc
+            self.doc_arrays = None
+            for token, weight in weights.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = ([], [])
+                    self.sorted_tokens = None
+                posting[0].append(doc)
+                posting[1].append(weight)
+                self.array_cache.pop(token, None)
+            added += 1
+        return added
+
+    def remove(self, vote_id, term):
+        doc = self.doc_by_key.pop(term_vote_key(term, vote_id), None)
+        if doc is not None:
+            self.alive[doc] = False
+            self.doc_arrays = None
+
+    def rebuild_keys(self):
+        self.doc_by_key = {term_vote_key(term, vote_id): doc
+                           for doc, (term, vote_id) in enumerate(zip(self.terms, self.vote_ids))}
+
+    def posting_arrays(self, token):
+        arrays = self.array_cache.get(token)
+        if arrays is None:
+            docs, weights = self.postings[token]
+            arrays = (np.asarray(docs, dtype=np.int64), np.asarray(weights, dtype=np.float64))
+            self.array_cache[token] = arrays
+        return arrays
+
+    def get_doc_arrays(self):
+        if self.doc_arrays is None:
+            alive = np.asarray(self.alive, dtype=bool)
+            lengths = np.asarray(self.lengths, dtype=np.float64)
+            self.doc_arrays = {
+                'alive': alive,
+                'lengths': lengths,
+                'days': np.asarray(self.days, dtype=np.int64),
+                'terms': np.asarray(self.terms, dtype=np.int64),
+                'avg_length': lengths[alive].mean() if alive.any() else 1.0,
+            }
+        return self.doc_arrays
+
+    def expand(self, token, prefix):
+        if not prefix:
+            return [token] if token in self.postings else []
+        if self.sorted_tokens is None:
+            self.sorted_tokens = sorted(self.postings)
+        start = bisect.bisect_left(self.sorted_tokens, token)
+        end = bisect.bisect_left(self.sorted_tokens, token + '\x7f')
+        return self.sorted_tokens[start:end]
+
+    def search(self, query, limit=20, start=None, end=None, term=None, prefix=True):
+        # All query words must match; the last one is also matched as a prefix (search as you type)
+        query_tokens = tokenize(query)
+        n_docs = len(self.vote_ids)
+        if not query_tokens or n_docs == 0:
+            return pd.DataFrame(columns=['VoteId', 'Date', 'EP', 'Score'])
+        arrays = self.get_doc_arrays()
+        alive = arrays['alive']
+        lengths = arrays['lengths']
+        days = arrays['days']
+        n_alive = alive.sum()
+        scores = np.zeros(n_docs)
+        mask = alive.copy()
+        for i, query_token in enumerate(query_tokens):
+            # A prefix may expand to many tokens; their contributions are summed in one bincount
+            all_docs = []
+            all_contributions = []
+            for token in self.expand(query_token, prefix and i == len(query_tokens) - 1):
+                docs, weights = self.posting_arrays(token)
+                doc_freq = alive[docs].sum()
+                idf = np.log(1 + (n_alive - doc_freq + 0.5) / (doc_freq + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / arrays['avg_length'])
+                all_docs.append(docs)
+                all_contributions.append(idf * weights * (BM25_K1 + 1) / (weights + norm))
+            if not all_docs:
+                mask[:] = False
+                break
+            docs = np.concatenate(all_docs)
+            scores += np.bincount(docs, weights=np.concatenate(all_contributions), minlength=n_docs)
+            hit = np.zeros(n_docs, dtype=bool)
+            hit[docs] = True
+            mask &= hit
+        if start is not None or end is not None:
+            if start is not None:
+                mask &= days >= date_to_day(start)
+            if end is not None:
+                mask &= (days <= date_to_day(end)) & (days != MISSING_DATE)
+        if term is not None:
+            mask &= arrays['terms'] == term
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        dates = days[candidates].astype('datetime64[D]')
+        dates[days[candidates] == MISSING_DATE] = np.datetime64('NaT')
+        return pd.DataFrame({
+            'VoteId': [self.vote_ids[doc] for doc in candidates],
+            'Date': pd.to_datetime(dates),
+            'EP': arrays['terms'][candidates],
+            'Score': scores[candidates],
+        })
+
+    def compact(self):
+        # Drop replaced documents before saving
+        if all(self.alive):
+            return
+        keep = [doc for doc, alive in enumerate(self.alive) if alive]
+        new_position = {doc: i for i, doc in enumerate(keep)}
+        postings = {}
+        for token, (docs, weights) in self.postings.items():
+            kept = [(new_position[doc], weight) for doc, weight in zip(docs, weights) if doc in new_position]
+            if kept:
+                postings[token] = ([doc for doc, _ in kept], [weight for _, weight in kept])
+        self.vote_ids = [self.vote_ids[doc] for doc in keep]
+        self.days = [self.days[doc] for doc in keep]
+        self.terms = [self.terms[doc] for doc in keep]
+        self.lengths = [self.lengths[doc] for doc in keep]
+        self.alive = [True] * len(keep)
+        self.rebuild_keys()
+        self.postings = postings
+        self.array_cache = {}
+        self.doc_arrays = None
+        self.sorted_tokens = None
+
+    def save(self, path):
+        self.compact()
+        data = {'vote_ids': self.vote_ids, 'days': self.days, 'terms': self.terms, 'lengths': self.lengths,
+                'postings': self.postings}
+        save_json_gz(path, data)
+
+    @classmethod
+    def load(cls, path):
+        data = load_json_gz(path)
+        index = cls()
+        index.vote_ids = data['vote_ids']
+        index.days = data['days']
+        index.terms = data['terms']
+        index.lengths = data['lengths']
+        index.alive = [True] * len(index.vote_ids)
+        index.rebuild_keys()
+        index.postings = {token: (docs, weights) for token, (docs, weights) in data['postings'].items()}
+        return index
+
+    load_or_create = classmethod(load_or_create)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('query', nargs='?')
+    parser.add_argument('--index', default=os.path.join("Cleaned_data", "votings_search_index.json.gz"))
+    parser.add_argument('--add', nargs='*', default=[], help="votings CSV files to add to the index")
+    parser.add_argument('--from', dest='start')
+    parser.add_argument('--to', dest='end')
+    parser.add_argument('--term', type=int)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    index = VotingsSearchIndex.load_or_create(args.index)
+    if args.add:
+        for path in args.add:
+            added = index.add_votings(pd.read_csv(path))
+            print(f"{added} votings from {path} added to the index")
+        index.save(args.index)
+    if args.query:
+        print(index.search(args.query, limit=args.limit, start=args.start, end=args.end, term=args.term)
+              .to_string(index=False))